@@ -0,0 +1,410 @@
+"""Benchmarks and consistency checks for the planner backend.
+
+Run from the repository root, for example:
+    python bench.py memory --tasks 1000000
+    python bench.py check
+Each command works on generated data in a temporary directory.
+"""
+import argparse
+import gc
+import json
+import mmap
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import smart
+
+# Default task counts: benchmarks want scale, checks want many quick iterations.
+BENCH_TASKS = 100000
+CHECK_TASKS = 2000
+
+def make_fixture(tasks, seed=0, subjects=20, chapters=5):
+    """Returns planner data in the JSON file shape with the given number of tasks."""
+    rng = random.Random(seed)
+    subject_list = [
+        {
+            'name': f'Subject {i}',
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'chapters': [{'id': str(uuid.UUID(int=rng.getrandbits(128))), 'name': f'Chapter {j}'}
+                         for j in range(chapters)]
+        }
+        for i in range(subjects)
+    ]
+    task_list = []
+    for i in range(tasks):
+        subject = rng.choice(subject_list)
+        task = {
+            'name': f'Task {i} - Chapter {i % 12}',
+            'date': date(2025, rng.randint(1, 12), rng.randint(1, 28)).isoformat(),
+            'subjectId': subject['id'],
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'completed': rng.random() < 0.3,
+            'pomodoroSessions': rng.randint(0, 8)
+        }
+        if rng.random() < 0.5:
+            task['chapterId'] = rng.choice(subject['chapters'])['id']
+        task_list.append(task)
+    return {'tasks': task_list, 'subjects': subject_list, 'journal': {}}
+
+@contextmanager
+def planner_dir(tasks):
+    """Runs the block in a temporary directory holding a generated planner_data.json."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        smart.SNAPSHOT_FILE = 'planner_data.snap'
+        smart._planner = None
+        try:
+            with open(smart.DATA_FILE, 'w') as f:
+                json.dump(make_fixture(tasks), f)
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+def bench_memory(args):
+    """Compares resident memory of the parsed JSON dicts with the slotted Planner."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'fixture.json')
+        with open(path, 'w') as f:
+            json.dump(make_fixture(args.tasks), f)
+        tracemalloc.start()
+        with open(path) as f:
+            data = json.load(f)
+        as_dicts = tracemalloc.get_traced_memory()[0]
+        planner = smart.Planner.from_dict(data)
+        del data
+        gc.collect()
+        as_planner = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    print(f'{len(planner.tasks)} tasks')
+    print(f'JSON dicts: {as_dicts / 1e6:.1f} MB')
+    print(f'Planner:    {as_planner / 1e6:.1f} MB')
+
+def _load(args):
+    # Runs in a fresh interpreter, so each cold load starts from an empty process.
+    start = time.perf_counter()
+    if args.source == 'json':
+        with open(smart.DATA_FILE) as f:
+            smart.Planner.from_dict(json.load(f))
+    elif smart.read_snapshot(smart._file_stamp()) is None:
+        sys.exit('snapshot is missing or stale')
+    print(time.perf_counter() - start)
+
+def bench_coldstart(args):
+    """Times a cold load of the planner from JSON and from the binary snapshot."""
+    with planner_dir(args.tasks) as tmp:
+        smart.load_data()
+        for source in ('json', 'snapshot'):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '_load', '--source', source],
+                                    cwd=tmp, check=True, capture_output=True, text=True).stdout
+            print(f'{source:8} cold load: {float(output):.2f} s')
+
+def _private_mb():
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if line.startswith('Private'))
+    return sum(int(v.split()[0]) for v in fields.values()) / 1024
+
+def _worker_private_mb(workers, preload):
+    # Forks workers like gunicorn does and returns their average private memory once
+    # each has loaded the planner and read every task.
+    if preload:
+        smart.load_data()
+        gc.freeze()
+    results = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            planner = smart.load_data()
+            sum(len(t.name) for t in planner.tasks)
+            os.write(write_end, str(_private_mb()).encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as f:
+            results.append(float(f.read()))
+        os.waitpid(pid, 0)
+    gc.unfreeze()
+    smart._planner = None
+    return sum(results) / len(results)
+
+def bench_rss(args):
+    """Compares per-worker private memory with and without preloading before fork."""
+    if not os.path.exists('/proc/self/smaps_rollup') or not hasattr(os, 'fork'):
+        sys.exit('rss needs Linux /proc/self/smaps_rollup and os.fork')
+    with planner_dir(args.tasks):
+        smart.load_data()
+        smart._planner = None
+        print(f'worker loads its own data: {_worker_private_mb(args.workers, False):.1f} MB private')
+        print(f'preloaded before fork:     {_worker_private_mb(args.workers, True):.1f} MB private')
+
+def _check(condition, message):
+    # Not assert, so the checks still run under python -O.
+    if not condition:
+        sys.exit(f'FAILED: {message}')
+
+def check_snapshot(args):
+    """Checks that a snapshot round-trips and that stale or corrupt ones are rejected."""
+    with planner_dir(args.tasks):
+        with open(smart.DATA_FILE) as f:
+            planner = smart.Planner.from_dict(json.load(f))
+        planner.add_task({'id': 'extra', 'name': None, 'date': '', 'subjectId': None, 'note': 'kept'})
+        planner.add_task({'id': 'number', 'name': 123, 'date': ''})
+        planner.add_task({'id': 'surrogate', 'name': 'lone \ud800 surrogate', 'date': ''})
+        planner.add_task({'id': 'unicode', 'name': 'Kapitel \u00fcber \u6570\u5b66', 'date': ''})
+        planner.add_task({'id': 'legacy', 'name': 'old date', 'date': '03/04/2025'}, stored=True)
+        planner.remove_task(planner.tasks[0].id)
+        planner.journal['2025-01-01'] = 'entry'
+        planner.session_offset = 123
+        planner.version = 7
+        planner.history.append({'op': 'add_task', 'at': '2025-01-01T00:00:00',
+                                'tasks': [['extra', None]], 'subjects': [], 'journal': []})
+        smart.write_snapshot(planner, (1, 2))
+
+        loaded = smart.read_snapshot((1, 2))
+        _check(loaded is not None, 'intact snapshot was rejected')
+        _check(loaded.to_dict() == planner.to_dict(), 'snapshot did not round-trip')
+        _check((loaded.session_offset, loaded.version, list(loaded.history))
+               == (planner.session_offset, planner.version, list(planner.history)), 'snapshot metadata differs')
+        _check(smart.read_snapshot() is not None, 'snapshot rejected without a stamp')
+        _check(smart.read_snapshot((1, 3)) is None, 'stale snapshot was accepted')
+
+        with open(smart.SNAPSHOT_FILE, 'rb') as f:
+            intact = f.read()
+        corrupt = bytearray(intact)
+        corrupt[len(corrupt) // 2] ^= 0xFF
+        for name, content in (('corrupt', corrupt), ('truncated', intact[:len(intact) // 2]), ('empty', b'')):
+            with open(smart.SNAPSHOT_FILE, 'wb') as f:
+                f.write(content)
+            _check(smart.read_snapshot((1, 2)) is None, f'{name} snapshot was accepted')
+    print('snapshot: ok')
+
+def check_schedule(args):
+    """Checks that incremental scheduler syncs give the same plan as a fresh scheduler
+    over a run of random task edits."""
+    data = make_fixture(args.tasks, seed=1)
+    planner = smart.Planner.from_dict(data)
+    chapters = {s['id']: [c['id'] for c in s['chapters']] for s in data['subjects']}
+    rng = random.Random(1)
+    start = date(2025, 1, 1).toordinal()
+    overrides = {start + 3: 0, start + 10: 9}
+    scheduler = smart.StudyScheduler(start, 6, overrides)
+    scheduler.sync(planner)
+    for step in range(args.edits):
+        task = rng.choice(planner.tasks)
+        edit = rng.randrange(5)
+        if edit == 0:
+            subject = rng.choice(data['subjects'])['id']
+            planner.add_task({'id': str(uuid.uuid4()), 'name': f'New {step}',
+                              'date': date.fromordinal(start + rng.randrange(300)).isoformat(),
+                              'subjectId': subject, 'chapterId': rng.choice(chapters[subject]),
+                              'estimatedPomodoros': rng.randint(1, 6)})
+        elif edit == 1:
+            planner.update_task(task, {'completed': not task.completed})
+        elif edit == 2:
+            planner.update_task(task, {'date': date.fromordinal(start + rng.randrange(300)).isoformat()})
+        elif edit == 3:
+            planner.update_task(task, {'pomodoroSessions': rng.randint(0, 8), 'estimatedPomodoros': rng.randint(0, 8)})
+        else:
+            planner.remove_task(task.id)
+        scheduler.sync(planner)
+        fresh = smart.StudyScheduler(start, 6, overrides)
+        fresh.sync(planner)
+        _check(scheduler.plan() == fresh.plan(), f'incremental plan differs after edit {step}')
+    print(f'schedule: ok ({args.edits} edits)')
+
+def check_sessions(args):
+    """Checks that repeated session keys are logged once and that study time is split
+    across hour buckets without losing or adding any."""
+    with tempfile.TemporaryDirectory() as tmp:
+        log = smart.SessionLog(os.path.join(tmp, smart.SESSIONS_FILE))
+        start = int(datetime(2025, 3, 10, 10, 50).timestamp())
+        _check(log.record('task', start, start + 1800, 'once'), 'first session was not logged')
+        _check(not log.record('task', start, start + 1800, 'once'), 'repeated key was logged again')
+        with open(log.path) as f:
+            _check(len(f.readlines()) == 1, 'repeated key was written to the log')
+        hour = datetime(2025, 3, 10).toordinal() * 24 + 10
+        _check(log.hourly.get(hour) == [1, 600] and log.hourly.get(hour + 1) == [0, 1200],
+               f'session was not split at the hour: {log.hourly}')
+
+        rng = random.Random(2)
+        total = 1800
+        for i in range(args.tasks):
+            session_start = start + rng.randrange(90 * 86400)
+            length = rng.randrange(smart.MAX_SESSION_SECONDS + 1)
+            log.record(f'task {i % 10}', session_start, session_start + length, f'key {i}')
+            total += length
+        for name, buckets in (('hourly', log.hourly), ('daily', log.daily)):
+            _check(sum(b[0] for b in buckets.values()) == args.tasks + 1, f'{name} session count is off')
+            _check(abs(sum(b[1] for b in buckets.values()) - total) < 1e-6, f'{name} study time is off')
+        first, last = date.fromordinal(min(log.daily)), date.fromordinal(max(log.daily))
+        _check(abs(sum(b['minutes'] for b in log.heatmap(first, last)) - total / 60) <= 0.05 * len(log.daily),
+               'heatmap minutes do not add up')
+
+        tailed = smart.SessionLog(log.path)
+        tailed.catch_up()
+        _check((tailed.keys, tailed.hourly, tailed.daily) == (log.keys, log.hourly, log.daily),
+               'a second reader of the log got different buckets')
+    print(f'sessions: ok ({args.tasks + 1} sessions)')
+
+def bench_history(args):
+    """Times update_task with and without history recording, and the memory per entry."""
+    planner = smart.Planner.from_dict(make_fixture(args.tasks))
+    task_ids = [t.id for t in planner.tasks]
+    rng = random.Random(0)
+
+    def run(record, count=1000):
+        start = time.perf_counter()
+        for i in range(count):
+            if record:
+                planner.begin_change()
+            smart.apply_update_task(planner, {'id': rng.choice(task_ids), 'name': f'Renamed {i}'})
+            if record:
+                planner.end_change('update_task')
+        return (time.perf_counter() - start) / count * 1e6
+
+    print(f'update_task without history: {run(False):.0f} us')
+    print(f'update_task with history:    {run(True):.0f} us')
+    planner.history.clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    run(True, smart.HISTORY_LIMIT)
+    per_entry = (tracemalloc.get_traced_memory()[0] - before) / smart.HISTORY_LIMIT
+    tracemalloc.stop()
+    print(f'history entry: {per_entry:.0f} bytes')
+    start = time.perf_counter()
+    json.dumps(planner.to_dict())
+    print(f'serialising the planner for a save, for scale: {(time.perf_counter() - start) * 1e3:.0f} ms')
+
+def _fork(target, *args):
+    # Runs target in a forked child; returns its pid and a pipe that yields its JSON result.
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = target(*args)
+        except BaseException as e:
+            result = {'error': repr(e)}
+        os.write(write_end, json.dumps(result).encode())
+        os._exit(0)
+    os.close(write_end)
+    return pid, os.fdopen(read_end)
+
+def _join(children):
+    results = []
+    for pid, pipe in children:
+        with pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    return results
+
+def _read_loop(task_ids, stop):
+    # One web worker's reads: follow the published snapshot and look a task up.
+    rng = random.Random(os.getpid())
+    reads, slowest, last_version = 0, 0.0, 0
+    start = time.perf_counter()
+    while not stop[0]:
+        read_start = time.perf_counter()
+        planner = smart.load_data()
+        planner.find_task(rng.choice(task_ids))
+        slowest = max(slowest, time.perf_counter() - read_start)
+        if planner.version < last_version:
+            return {'error': f'version went back from {last_version} to {planner.version}'}
+        last_version = planner.version
+        reads += 1
+    return {'reads': reads, 'seconds': time.perf_counter() - start, 'slowest': slowest}
+
+def _write_loop(count, tag):
+    return {'versions': [smart.mutate('add_task', {'name': f'{tag} {i}', 'date': '2025-06-01'})
+                         for i in range(count)]}
+
+def bench_replicas(args):
+    """Runs forked readers against a single writer process while other processes write,
+    and reports read throughput per reader count and whether every write landed once."""
+    if not hasattr(os, 'fork') or not hasattr(socket, 'AF_UNIX'):
+        sys.exit('replicas needs os.fork and unix sockets')
+    with planner_dir(args.tasks) as tmp:
+        socket_path = os.path.join(tmp, 'writer.sock')
+        env = {**os.environ, 'PLANNER_WRITER_SOCKET': socket_path, 'PLANNER_SNAPSHOT': smart.SNAPSHOT_FILE}
+        writer = subprocess.Popen([sys.executable, os.path.abspath(smart.__file__), '--writer'], cwd=tmp, env=env)
+        try:
+            while not os.path.exists(socket_path):
+                _check(writer.poll() is None, 'writer process exited on startup')
+                time.sleep(0.05)
+            smart.WRITER_SOCKET = socket_path
+            planner = smart.load_data()
+            task_ids = [t.id for t in planner.tasks]
+            first_count, first_version = len(planner.tasks), planner.version
+            gc.freeze()
+            stop = mmap.mmap(-1, 1)
+            writes = 0
+            readers = 1
+            while readers <= args.workers:
+                stop[0] = 0
+                reading = [_fork(_read_loop, task_ids, stop) for _ in range(readers)]
+                writing = [_fork(_write_loop, args.writes // 2, f'Writer {j}') for j in range(2)]
+                written = _join(writing)
+                stop[0] = 1
+                results = _join(reading)
+                for result in written + results:
+                    _check('error' not in result, f"child failed: {result.get('error')}")
+                versions = sorted(v for result in written for v in result['versions'])
+                _check(versions == list(range(first_version + writes + 1, first_version + writes + len(versions) + 1)),
+                       'concurrent writes did not get one version each')
+                writes += len(versions)
+                rate = sum(r['reads'] / r['seconds'] for r in results)
+                slowest = max(r['slowest'] for r in results)
+                print(f'{readers} readers: {rate:8.0f} reads/s, slowest read {slowest * 1e3:.0f} ms '
+                      f'({len(versions)} concurrent writes)')
+                readers *= 2
+            gc.unfreeze()
+            planner = smart.load_data()
+            with open(smart.DATA_FILE) as f:
+                saved = json.load(f)
+            _check(len(planner.tasks) == len(saved['tasks']) == first_count + writes, 'a write was lost or repeated')
+            _check(planner.version == first_version + writes, 'snapshot version does not match the writes')
+            print(f'{writes} writes applied once each; readers never saw the version go back')
+        finally:
+            smart.WRITER_SOCKET = None
+            writer.terminate()
+            writer.wait()
+
+COMMANDS = {
+    'memory': bench_memory,
+    'coldstart': bench_coldstart,
+    'rss': bench_rss,
+    'check-snapshot': check_snapshot,
+    'check-schedule': check_schedule,
+    'check-sessions': check_sessions,
+    'check': lambda args: (check_snapshot(args), check_schedule(args), check_sessions(args)),
+    'history': bench_history,
+    'replicas': bench_replicas,
+    '_load': _load
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--tasks', type=int, help=f'number of tasks to generate (default {BENCH_TASKS}, '
+                        f'or {CHECK_TASKS} for checks)')
+    parser.add_argument('--workers', type=int, default=4, help='forked workers for rss, most readers for replicas')
+    parser.add_argument('--writes', type=int, default=20, help='writes per round for replicas')
+    parser.add_argument('--edits', type=int, default=400, help='random edits for check-schedule')
+    parser.add_argument('--source', choices=('json', 'snapshot'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.tasks is None:
+        args.tasks = CHECK_TASKS if args.command.startswith('check') else BENCH_TASKS
+    COMMANDS[args.command](args)
+
+if __name__ == '__main__':
+    main()
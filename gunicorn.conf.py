@@ -0,0 +1,52 @@
+# Gunicorn settings for the study planner: gunicorn smart:app
+import gc
+import os
+import subprocess
+import sys
+import threading
+
+# Import the app, and load planner data, once in the master so forked workers
+# share those pages copy-on-write instead of each parsing the data file.
+preload_app = True
+
+# Set PLANNER_WRITER_SOCKET (and ideally PLANNER_SNAPSHOT=/dev/shm/...) to run one
+# writer process next to the workers; workers forward every mutation to it.
+WRITER_RESTART_DELAY = 1
+_writer = None
+_supervisor = None
+_stopping = threading.Event()
+
+def _supervise_writer(server, smart_path):
+    """Runs the writer process, restarting it whenever it exits until the master stops."""
+    global _writer
+    while not _stopping.is_set():
+        _writer = subprocess.Popen([sys.executable, smart_path, '--writer'])
+        code = _writer.wait()
+        if not _stopping.is_set():
+            server.log.warning('Writer process exited with %s; restarting it', code)
+            # A short pause keeps a writer that fails on startup from spinning.
+            _stopping.wait(WRITER_RESTART_DELAY)
+
+def on_starting(server):
+    """Starts the supervised writer process when single-writer mode is configured."""
+    global _supervisor
+    if os.environ.get('PLANNER_WRITER_SOCKET'):
+        smart_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'smart.py')
+        _supervisor = threading.Thread(target=_supervise_writer, args=(server, smart_path), daemon=True)
+        _supervisor.start()
+
+def when_ready(server):
+    """Loads the planner in the master before any worker is forked."""
+    import smart
+    smart.load_data()
+    # Keep the GC from touching (and so copying) the preloaded objects in workers.
+    gc.freeze()
+
+def on_exit(server):
+    """Stops the writer process along with the master."""
+    _stopping.set()
+    if _writer is not None:
+        _writer.terminate()
+        _writer.wait()
+    if _supervisor is not None:
+        _supervisor.join()
@@ -1,28 +1,711 @@
+import bisect
+import fcntl
+import gc
 import json
+import mmap
 import os
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
 import uuid
-from datetime import datetime
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import accumulate, chain
+from datetime import date, datetime, timedelta
 from flask import Flask, request, jsonify, render_template_string
 
 # Initialize Flask app
 app = Flask(__name__)
 
-# Define data file path
+# Define data file paths
 DATA_FILE = 'planner_data.json'
+SNAPSHOT_FILE = os.environ.get('PLANNER_SNAPSHOT', 'planner_data.snap')
+SESSIONS_FILE = 'pomodoro_sessions.log'
+
+# Single-writer mode: when set, one writer process (python smart.py --writer) owns all
+# mutations on this unix socket and web workers serve reads from its published snapshot.
+# Point PLANNER_SNAPSHOT at /dev/shm so that snapshot lives in shared memory.
+WRITER_SOCKET = os.environ.get('PLANNER_WRITER_SOCKET')
+WRITER_TIMEOUT = 10
+# Well under WRITER_TIMEOUT, so workers queued behind a stalled connection still get served.
+WRITER_READ_TIMEOUT = 2
+
+# --- Data Model ---
+# Tasks, subjects and chapters are held as slotted records while the app runs.
+# The JSON dict shape only exists at the boundary: the data file and API payloads.
+
+def _date_ordinal(value):
+    """Converts a 'YYYY-MM-DD' string to a date ordinal, or 0 for no date. Raises
+    ValueError for anything else."""
+    try:
+        return date.fromisoformat(value).toordinal() if value else 0
+    except (TypeError, ValueError):
+        raise ValueError('date must be YYYY-MM-DD.') from None
+
+def _pomodoro_count(value, key):
+    """Validates a pomodoro count for the planner's unsigned 32-bit arrays."""
+    try:
+        count = int(value or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be a whole number.') from None
+    if not 0 <= count <= 0xFFFFFFFF:
+        raise ValueError(f'{key} is out of range.')
+    return count
+
+class Chapter:
+    """A chapter of a subject."""
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name}
+
+class Subject:
+    """A subject and its ordered chapters. Unknown JSON keys are kept in 'extra'."""
+    __slots__ = ('id', 'name', 'chapters', 'extra')
+
+    def __init__(self, id, name, chapters=None, extra=None):
+        self.id = sys.intern(id)
+        self.name = name
+        self.chapters = chapters or []
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {k: v for k, v in data.items() if k not in ('id', 'name', 'chapters')} or None
+        chapters = [Chapter(c['id'], c.get('name')) for c in data.get('chapters', [])]
+        return cls(data['id'], data.get('name'), chapters, extra)
+
+    def to_dict(self):
+        data = {'name': self.name}
+        if self.extra:
+            data.update(self.extra)
+        data['id'] = self.id
+        data['chapters'] = [c.to_dict() for c in self.chapters]
+        return data
+
+class Task:
+    """A task record. Its date, pomodoro count and effort estimate live in the
+    owning Planner's arrays at index 'slot'. Unknown JSON keys are kept in 'extra'."""
+    __slots__ = ('id', 'name', 'subject_id', 'chapter_id', 'completed', 'slot', 'extra')
+
+    def __init__(self, id, name, subject_id, chapter_id, completed, slot, extra=None):
+        self.id = id
+        self.name = name
+        self.subject_id = sys.intern(subject_id) if subject_id else subject_id
+        self.chapter_id = chapter_id
+        self.completed = completed
+        self.slot = slot
+        self.extra = extra
+
+HISTORY_LIMIT = 50
+
+TASK_KEYS = ('id', 'name', 'date', 'subjectId', 'chapterId', 'completed', 'pomodoroSessions', 'estimatedPomodoros')
+
+class Planner:
+    """All planner data. Per-task numbers are packed into arrays indexed by Task.slot.
+
+    Between begin_change() and end_change() the mutating methods keep the first
+    pre-image of every task, subject and journal day they touch, so each history
+    entry costs only as much as the records that changed.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.subjects = []
+        self.journal = {}
+        self.dates = array('i')
+        self.sessions = array('I')
+        self.efforts = array('I')
+        self._free_slots = []
+        self.version = 0
+        # Byte offset into SESSIONS_FILE up to which sessions are counted in 'sessions'.
+        self.session_offset = 0
+        self.history = deque(maxlen=HISTORY_LIMIT)
+        self._changes = None
+
+    @classmethod
+    def from_dict(cls, data):
+        planner = cls()
+        planner.subjects = [Subject.from_dict(s) for s in data.get('subjects', [])]
+        for task in data.get('tasks', []):
+            planner.add_task(task, stored=True)
+        planner.journal = data.get('journal', {})
+        planner.session_offset = data.get('sessionLogOffset', 0)
+        planner.history.extend(data.get('history', []))
+        return planner
+
+    def to_dict(self):
+        return {
+            'tasks': [self.task_to_dict(t) for t in self.tasks],
+            'subjects': [s.to_dict() for s in self.subjects],
+            'journal': self.journal
+        }
+
+    def task_to_dict(self, task):
+        ordinal = self.dates[task.slot]
+        data = {
+            'name': task.name,
+            'date': date.fromordinal(ordinal).isoformat() if ordinal else '',
+            'subjectId': task.subject_id
+        }
+        if task.chapter_id is not None:
+            data['chapterId'] = task.chapter_id
+        if self.efforts[task.slot]:
+            data['estimatedPomodoros'] = self.efforts[task.slot]
+        if task.extra:
+            data.update(task.extra)
+        data['id'] = task.id
+        data['completed'] = task.completed
+        data['pomodoroSessions'] = self.sessions[task.slot]
+        return data
+
+    def add_task(self, fields, stored=False):
+        """Creates a task from a JSON dict and returns it. See _coerce_task_fields for
+        'stored'."""
+        values = self._coerce_task_fields(fields, stored)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self.dates)
+            self.dates.append(0)
+            self.sessions.append(0)
+            self.efforts.append(0)
+        self._record('tasks', fields['id'], None)
+        task = Task(fields['id'], None, None, None, False, slot)
+        self._apply_task_fields(task, values)
+        self.tasks.append(task)
+        return task
+
+    def update_task(self, task, fields):
+        """Applies the keys of a JSON dict to a task."""
+        values = self._coerce_task_fields(fields)
+        if self._changes is not None:
+            self._record('tasks', task.id, [None, self.task_to_dict(task)])
+        self._apply_task_fields(task, values)
+
+    @staticmethod
+    def _coerce_task_fields(fields, stored=False):
+        """Converts a task's JSON dict to record values, raising ValueError on bad
+        values before the task is touched. A 'stored' dict comes from the data file or
+        history, where a date this version cannot parse is kept as-is in 'extra'."""
+        values = {}
+        extra = {k: v for k, v in fields.items() if k not in TASK_KEYS}
+        if 'name' in fields:
+            values['name'] = fields['name']
+        if 'date' in fields:
+            try:
+                values['date'] = _date_ordinal(fields['date'])
+            except ValueError:
+                if not stored:
+                    raise
+                values['date'] = 0
+                extra['date'] = fields['date']
+        if 'subjectId' in fields:
+            subject_id = fields['subjectId']
+            if subject_id is not None and not isinstance(subject_id, str):
+                raise ValueError('subjectId must be a string.')
+            values['subjectId'] = sys.intern(subject_id) if subject_id else subject_id
+        if 'chapterId' in fields:
+            values['chapterId'] = fields['chapterId']
+        if 'completed' in fields:
+            values['completed'] = bool(fields['completed'])
+        for key in ('pomodoroSessions', 'estimatedPomodoros'):
+            if key in fields:
+                values[key] = _pomodoro_count(fields[key], key)
+        values['extra'] = extra
+        return values
+
+    def _apply_task_fields(self, task, values):
+        slot = task.slot
+        if 'name' in values:
+            task.name = values['name']
+        if 'date' in values:
+            self.dates[slot] = values['date']
+            if task.extra and 'date' in task.extra:
+                task.extra = {k: v for k, v in task.extra.items() if k != 'date'} or None
+        if 'subjectId' in values:
+            task.subject_id = values['subjectId']
+        if 'chapterId' in values:
+            task.chapter_id = values['chapterId']
+        if 'completed' in values:
+            task.completed = values['completed']
+        if 'pomodoroSessions' in values:
+            self.sessions[slot] = values['pomodoroSessions']
+        if 'estimatedPomodoros' in values:
+            self.efforts[slot] = values['estimatedPomodoros']
+        if values['extra']:
+            task.extra = {**(task.extra or {}), **values['extra']}
+
+    def find_task(self, task_id):
+        for task in self.tasks:
+            if task.id == task_id:
+                return task
+        return None
+
+    def remove_task(self, task_id):
+        for index, task in enumerate(self.tasks):
+            if task.id == task_id:
+                if self._changes is not None:
+                    self._record('tasks', task_id, [index, self.task_to_dict(task)])
+                del self.tasks[index]
+                self.dates[task.slot] = self.sessions[task.slot] = self.efforts[task.slot] = 0
+                self._free_slots.append(task.slot)
+                return
+
+    def find_subject(self, subject_id):
+        for subject in self.subjects:
+            if subject.id == subject_id:
+                return subject
+        return None
+
+    def add_subject(self, fields):
+        self._record('subjects', fields['id'], None)
+        self.subjects.append(Subject.from_dict(fields))
+
+    def touch_subject(self, subject):
+        """Records a subject's pre-image before it is changed in place."""
+        if self._changes is not None:
+            self._record('subjects', subject.id, [None, subject.to_dict()])
+
+    def remove_subject(self, subject_id):
+        for index, subject in enumerate(self.subjects):
+            if subject.id == subject_id:
+                if self._changes is not None:
+                    self._record('subjects', subject_id, [index, subject.to_dict()])
+                del self.subjects[index]
+                return
+
+    def set_journal(self, day, text):
+        self._record('journal', day, self.journal.get(day))
+        self.journal[day] = text
+
+    # --- History ---
+    def begin_change(self):
+        self._changes = {'tasks': {}, 'subjects': {}, 'journal': {}}
+
+    def _record(self, kind, key, before):
+        if self._changes is not None and key not in self._changes[kind]:
+            self._changes[kind][key] = before
+
+    def end_change(self, op):
+        """Closes the current change and keeps it in history if anything changed."""
+        changes, self._changes = self._changes, None
+        if changes and any(changes.values()):
+            self.history.append({
+                'op': op,
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'tasks': list(changes['tasks'].items()),
+                'subjects': list(changes['subjects'].items()),
+                'journal': list(changes['journal'].items())
+            })
+
+    def undo(self):
+        """Restores the pre-images of the latest history entry. Returns its op, or None."""
+        self._changes = None
+        if not self.history:
+            return None
+        entry = self.history.pop()
+        for task_id, before in entry['tasks']:
+            task = self.find_task(task_id)
+            if before is None:
+                self.remove_task(task_id)
+            elif task is not None:
+                # Sessions logged since the change stay counted.
+                fields = {k: v for k, v in before[1].items() if k != 'pomodoroSessions'}
+                task.extra = task.chapter_id = None
+                self.efforts[task.slot] = 0
+                self._apply_task_fields(task, self._coerce_task_fields(fields, stored=True))
+            else:
+                self.add_task(before[1], stored=True)
+                self.tasks.insert(before[0], self.tasks.pop())
+        for subject_id, before in entry['subjects']:
+            subject = self.find_subject(subject_id)
+            if before is None:
+                self.remove_subject(subject_id)
+            elif subject is not None:
+                self.subjects[self.subjects.index(subject)] = Subject.from_dict(before[1])
+            else:
+                self.subjects.insert(before[0], Subject.from_dict(before[1]))
+        for day, before in entry['journal']:
+            if before is None:
+                self.journal.pop(day, None)
+            else:
+                self.journal[day] = before
+        return entry['op']
+
+# --- Binary Snapshot ---
+# A snapshot is a derived copy of DATA_FILE that loads without parsing JSON per task:
+#   header: magic, format version, byte order, crc32 of the payload, payload length,
+#           the (mtime_ns, size) of the JSON file it was taken from, and the
+#           planner version (bumped on every save) it captures
+#   payload: length-prefixed sections, in SNAPSHOT_SECTIONS order
+# Per-task numbers are raw array bytes; ids and names are one UTF-8 blob per column
+# plus an array of cumulative character offsets; subject/chapter ids are indexes into
+# small tables kept in the JSON 'meta' section with subjects, journal, extra keys and
+# any names that are not encodable text.
+SNAPSHOT_MAGIC = b'STUDPLAN'
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct('<8sHBIQqqq')
+SNAPSHOT_SECTION = struct.Struct('<Q')
+SNAPSHOT_SECTIONS = ('meta', 'dates', 'sessions', 'efforts', 'completed',
+                     'subjects', 'chapters', 'id_ends', 'ids', 'name_ends', 'names')
+
+def _string_column(values):
+    ends = array('I', accumulate(len(v) for v in values))
+    return ends.tobytes(), ''.join(values).encode('utf-8')
+
+def _names_column(tasks, other_names):
+    # Names that are not encodable text (None, numbers, lone surrogates) go to 'meta'.
+    names = []
+    for i, task in enumerate(tasks):
+        if isinstance(task.name, str):
+            names.append(task.name)
+        else:
+            other_names[i] = task.name
+            names.append('')
+    try:
+        return _string_column(names)
+    except UnicodeEncodeError:
+        for i, name in enumerate(names):
+            try:
+                name.encode('utf-8')
+            except UnicodeEncodeError:
+                other_names[i] = name
+                names[i] = ''
+        return _string_column(names)
+
+def _split_column(ends_bytes, blob):
+    ends = array('I')
+    ends.frombytes(ends_bytes)
+    text = str(blob, 'utf-8')
+    return [text[a:b] for a, b in zip(chain((0,), ends), ends)]
+
+def _index_column(values, table):
+    positions = {}
+    for value in values:
+        if value is not None and value not in positions:
+            positions[value] = len(table)
+            table.append(value)
+    return array('i', (positions[v] if v is not None else -1 for v in values)).tobytes()
+
+def write_snapshot(planner, stamp):
+    """Writes a binary snapshot of the planner, tagged with the JSON file stamp it matches."""
+    tasks = planner.tasks
+    slots = [t.slot for t in tasks]
+    subject_table, chapter_table = [], []
+    other_names = {}
+    meta = {
+        'subjects': [s.to_dict() for s in planner.subjects],
+        'journal': planner.journal,
+        'extras': {i: t.extra for i, t in enumerate(tasks) if t.extra},
+        'otherNames': other_names,
+        'sessionLogOffset': planner.session_offset,
+        'history': list(planner.history)
+    }
+    columns = {
+        'dates': array('i', (planner.dates[i] for i in slots)).tobytes(),
+        'sessions': array('I', (planner.sessions[i] for i in slots)).tobytes(),
+        'efforts': array('I', (planner.efforts[i] for i in slots)).tobytes(),
+        'completed': bytes(t.completed for t in tasks),
+        'subjects': _index_column([t.subject_id for t in tasks], subject_table),
+        'chapters': _index_column([t.chapter_id for t in tasks], chapter_table)
+    }
+    columns['id_ends'], columns['ids'] = _string_column([t.id for t in tasks])
+    columns['name_ends'], columns['names'] = _names_column(tasks, other_names)
+    meta['subjectIds'] = subject_table
+    meta['chapterIds'] = chapter_table
+    columns['meta'] = json.dumps(meta).encode('utf-8')
+
+    payload = b''.join(SNAPSHOT_SECTION.pack(len(columns[name])) + columns[name] for name in SNAPSHOT_SECTIONS)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'little',
+                                  zlib.crc32(payload), len(payload), *stamp, planner.version)
+    # A unique temp file per writer, so concurrent saves never replace each other's file.
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(SNAPSHOT_FILE) or '.', prefix=os.path.basename(SNAPSHOT_FILE) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_file, SNAPSHOT_FILE)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+def read_snapshot(stamp=None):
+    """Loads the planner from the snapshot, or returns None if it is missing, stale or corrupt.
+    With no stamp, any intact snapshot is accepted."""
+    try:
+        with open(SNAPSHOT_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return _planner_from_snapshot(view, stamp)
+    except (OSError, ValueError, BufferError, struct.error, KeyError, IndexError):
+        return None
+
+def _planner_from_snapshot(view, stamp):
+    magic, version, little, crc, length, mtime_ns, size, planner_version = SNAPSHOT_HEADER.unpack_from(view)
+    payload = view[SNAPSHOT_HEADER.size:]
+    if (magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or little != (sys.byteorder == 'little')
+            or stamp not in (None, (mtime_ns, size)) or len(payload) != length or zlib.crc32(payload) != crc):
+        return None
+    sections = {}
+    offset = 0
+    for name in SNAPSHOT_SECTIONS:
+        (section_length,) = SNAPSHOT_SECTION.unpack_from(payload, offset)
+        offset += SNAPSHOT_SECTION.size
+        sections[name] = payload[offset:offset + section_length]
+        offset += section_length
+
+    meta = json.loads(str(sections['meta'], 'utf-8'))
+    planner = Planner()
+    planner.version = planner_version
+    planner.subjects = [Subject.from_dict(s) for s in meta['subjects']]
+    planner.journal = meta['journal']
+    planner.session_offset = meta['sessionLogOffset']
+    planner.history.extend(meta['history'])
+    planner.dates.frombytes(sections['dates'])
+    planner.sessions.frombytes(sections['sessions'])
+    planner.efforts.frombytes(sections['efforts'])
+    subject_ids = array('i')
+    subject_ids.frombytes(sections['subjects'])
+    chapter_ids = array('i')
+    chapter_ids.frombytes(sections['chapters'])
+    subject_table = [sys.intern(s) if s else s for s in meta['subjectIds']] + [None]
+    chapter_table = meta['chapterIds'] + [None]
+    ids = _split_column(sections['id_ends'], sections['ids'])
+    names = _split_column(sections['name_ends'], sections['names'])
+    for i, name in meta['otherNames'].items():
+        names[int(i)] = name
+    completed = bytes(sections['completed'])
+    if not len(ids) == len(names) == len(completed) == len(subject_ids) == len(chapter_ids) == len(planner.dates):
+        raise ValueError('snapshot columns differ in length')
+
+    # Building a million records trips the cyclic GC over and over; none of them form cycles.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        planner.tasks = [
+            Task(task_id, name, subject_table[subject], chapter_table[chapter], done == 1, slot)
+            for slot, (task_id, name, subject, chapter, done)
+            in enumerate(zip(ids, names, subject_ids, chapter_ids, completed))
+        ]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    for i, extra in meta['extras'].items():
+        planner.tasks[int(i)].extra = extra
+    return planner
+
+# --- Pomodoro Sessions ---
+# Completed sessions are appended to SESSIONS_FILE, one JSON object per line:
+#   {"key": idempotency key, "taskId": ..., "start": epoch s, "end": epoch s, "duration": s}
+# Each process tails the log from the last byte offset it has read, so nothing is
+# rewritten and appends from other workers are picked up incrementally.
+POMODORO_SECONDS = 25 * 60
+MAX_SESSION_SECONDS = 4 * 3600
+MAX_CLOCK_SKEW_SECONDS = 24 * 3600
+MAX_HEATMAP_DAYS = 366
+
+class SessionLog:
+    """Append-only pomodoro session log with per-hour and per-day study time buckets.
+
+    Buckets are keyed by local date ordinal (day) or ordinal * 24 + hour (hour) and hold
+    [sessions started, seconds studied]; a session's time is split across the buckets
+    it spans and it is counted in the bucket it started in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.keys = set()
+        self.hourly = {}
+        self.daily = {}
+        self._lock = threading.Lock()
+
+    def read_events(self, offset):
+        """Returns the complete events after byte offset and the offset they end at."""
+        try:
+            with open(self.path, 'rb') as f:
+                if offset > os.fstat(f.fileno()).st_size:
+                    # The log was replaced by a shorter one; everything in it is new.
+                    offset = 0
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], offset
+        # A line still being appended by another process is left for the next read.
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        events = []
+        for line in complete.splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(event, dict):
+                events.append(event)
+        return events, offset + len(complete)
+
+    def catch_up(self):
+        """Folds events appended since the last read into the keys and buckets."""
+        events, self.offset = self.read_events(self.offset)
+        for event in events:
+            self._add_to_buckets(event)
+
+    def _add_to_buckets(self, event):
+        if isinstance(event.get('key'), str):
+            self.keys.add(event['key'])
+        try:
+            start, end = int(event['start']), int(event['end'])
+            if not 0 <= end - start <= MAX_SESSION_SECONDS:
+                return
+            current = datetime.fromtimestamp(start)
+            end = datetime.fromtimestamp(end)
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            # A malformed line keeps its key but adds no study time.
+            return
+        first = True
+        while first or current < end:
+            hour_start = current.replace(minute=0, second=0, microsecond=0)
+            piece_end = min(hour_start + timedelta(hours=1), end)
+            seconds = (piece_end - current).total_seconds()
+            for buckets, key in ((self.hourly, hour_start.toordinal() * 24 + hour_start.hour),
+                                 (self.daily, hour_start.toordinal())):
+                bucket = buckets.setdefault(key, [0, 0])
+                bucket[0] += first
+                bucket[1] += seconds
+            first = False
+            current = piece_end
+
+    def record(self, task_id, start, end, key):
+        """Appends a session unless its idempotency key was already logged. Returns
+        whether it was appended."""
+        with self._lock, open(self.path, 'ab') as f:
+            # The file lock orders appends from other workers with our duplicate check.
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self.catch_up()
+                if key in self.keys:
+                    return False
+                event = {'key': key, 'taskId': task_id, 'start': start, 'end': end, 'duration': end - start}
+                f.write(json.dumps(event).encode('utf-8') + b'\n')
+                f.flush()
+                self.catch_up()
+                return True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def count_into(self, planner):
+        """Adds sessions logged after planner.session_offset to the planner's task counts."""
+        events, offset = self.read_events(planner.session_offset)
+        if events:
+            counts = {}
+            for event in events:
+                counts[event.get('taskId')] = counts.get(event.get('taskId'), 0) + 1
+            for task in planner.tasks:
+                if task.id in counts:
+                    planner.sessions[task.slot] += counts[task.id]
+        planner.session_offset = offset
+        return planner
+
+    def heatmap(self, start, end, granularity='day'):
+        """Returns every bucket from start to end (dates, inclusive), empty ones included."""
+        with self._lock:
+            self.catch_up()
+        first, last = start.toordinal(), end.toordinal()
+        if granularity == 'hour':
+            return [
+                {
+                    'hour': datetime.fromordinal(key // 24).replace(hour=key % 24).isoformat(timespec='hours'),
+                    'sessions': self.hourly.get(key, (0, 0))[0],
+                    'minutes': round(self.hourly.get(key, (0, 0))[1] / 60, 1)
+                }
+                for key in range(first * 24, (last + 1) * 24)
+            ]
+        return [
+            {
+                'date': date.fromordinal(key).isoformat(),
+                'sessions': self.daily.get(key, (0, 0))[0],
+                'minutes': round(self.daily.get(key, (0, 0))[1] / 60, 1)
+            }
+            for key in range(first, last + 1)
+        ]
+
+session_log = SessionLog(SESSIONS_FILE)
 
 # --- Data Persistence Functions ---
+_planner = None
+_planner_stamp = None
+_is_writer = False
+
+def _file_stamp(path=DATA_FILE):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _publish_snapshot(planner, stamp):
+    # The snapshot is only a cache of DATA_FILE; failing to write it must not fail the request.
+    # The writer is the exception: replicas only see writes it publishes, so it must not hide
+    # a failure and report a write that readers will never see as successful.
+    try:
+        write_snapshot(planner, stamp)
+    except Exception as e:
+        if _is_writer:
+            raise WriterError(f'Saved, but could not publish the change to readers: {e}') from e
+
+def _is_replica():
+    return bool(WRITER_SOCKET) and not _is_writer
+
 def load_data():
-    """Loads planner data from the JSON file. Creates an empty file if it doesn't exist or is empty."""
+    """Returns the resident planner, re-reading the JSON file only when it changed on disk.
+    Creates an empty file if it doesn't exist or is empty. In single-writer mode, web
+    workers follow the snapshot the writer publishes instead. Pomodoro sessions logged
+    since the planner was saved are counted in before it is returned."""
+    return session_log.count_into(_load_planner())
+
+def _load_planner():
+    global _planner, _planner_stamp
+    if _is_replica() and os.path.exists(SNAPSHOT_FILE):
+        stamp = _file_stamp(SNAPSHOT_FILE)
+        if _planner is not None and stamp == _planner_stamp:
+            return _planner
+        planner = read_snapshot()
+        if planner is not None:
+            _planner = planner
+            _planner_stamp = stamp
+            return _planner
     if not os.path.exists(DATA_FILE) or os.stat(DATA_FILE).st_size == 0:
-        save_data({'tasks': [], 'subjects': [], 'journal': {}})
-        return {'tasks': [], 'subjects': [], 'journal': {}}
-    with open(DATA_FILE, 'r') as f:
-        return json.load(f)
+        planner = Planner()
+        save_data(planner)
+        return planner
+    stamp = _file_stamp()
+    if _planner is None or stamp != _planner_stamp:
+        planner = read_snapshot(stamp)
+        if planner is None:
+            with open(DATA_FILE, 'r') as f:
+                planner = Planner.from_dict(json.load(f))
+            if not _is_replica():
+                _publish_snapshot(planner, stamp)
+        _planner = planner
+        _planner_stamp = stamp
+    return _planner
 
-def save_data(data):
-    """Saves planner data to the JSON file."""
+def save_data(planner):
+    """Saves planner data to the JSON file and publishes a new binary snapshot."""
+    global _planner, _planner_stamp
+    planner.version += 1
     with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+        json.dump({**planner.to_dict(), 'sessionLogOffset': planner.session_offset,
+                   'history': list(planner.history)}, f, indent=4)
+    _planner = planner
+    _planner_stamp = _file_stamp()
+    _publish_snapshot(planner, _planner_stamp)
 
 # --- Main App Route ---
 @app.route('/')
@@ -138,6 +821,9 @@ def index():
     <div class="container relative flex flex-col items-center p-4 md:p-8">
         <div class="card w-full max-w-4xl mx-auto rounded-3xl shadow-2xl p-6 md:p-10 text-gray-800">
             <h1 class="text-4xl md:text-5xl font-bold text-center mb-2 text-purple-800">Study Planner</h1>
+            <div class="flex justify-end mb-2">
+                <button id="undo-btn" class="bg-gray-200 text-gray-700 py-2 px-4 rounded-full text-sm font-medium hover:bg-gray-300 transition-colors">Undo</button>
+            </div>
 
             <!-- Tabs Navigation & Main Content -->
             <div id="main-content" class="block">
@@ -431,6 +1117,15 @@ def index():
                 }
             });
 
+            document.getElementById('undo-btn').addEventListener('click', async () => {
+                const response = await fetch('/undo', { method: 'POST' });
+                if (response.ok) {
+                    fetchData();
+                } else {
+                    showModal('Failed to undo.');
+                }
+            });
+
             // --- Calendar ---
             let currentDate = new Date();
             const calendarTooltip = document.getElementById('calendar-tooltip');
@@ -526,6 +1221,7 @@ def index():
             let timerInterval;
             let isTimerRunning = false;
             let activeTaskId = null;
+            let sessionStartedAt = null;
             
             function formatTime(seconds) {
                 const minutes = Math.floor(seconds / 60);
@@ -541,6 +1237,7 @@ def index():
                 if (!activeTaskId) { showModal("Please select a task."); return; }
                 
                 isTimerRunning = true;
+                if (sessionStartedAt === null) sessionStartedAt = Date.now();
                 document.getElementById('pomodoro-status').textContent = `Focusing on: ${document.getElementById('pomodoro-task-select').options[document.getElementById('pomodoro-task-select').selectedIndex].text}`;
                 timerInterval = setInterval(() => {
                     if (pomodoroTime > 0) {
@@ -551,11 +1248,22 @@ def index():
                         isTimerRunning = false;
                         showModal("Session Complete!");
                         document.getElementById('pomodoro-status').textContent = "Session Complete!";
-                        fetch('/increment_pomodoro', {
+                        // The key makes a retried POST count the session only once. The timer
+                        // only runs while unpaused, so the study time is its full length.
+                        const sessionEnd = Math.floor(Date.now() / 1000);
+                        const session = JSON.stringify({
+                            'id': activeTaskId,
+                            'idempotencyKey': `${activeTaskId}-${sessionStartedAt}`,
+                            'start': sessionEnd - 25 * 60,
+                            'end': sessionEnd
+                        });
+                        sessionStartedAt = null;
+                        const postSession = () => fetch('/increment_pomodoro', {
                             method: 'POST',
                             headers: {'Content-Type': 'application/json'},
-                            body: JSON.stringify({ 'id': activeTaskId })
+                            body: session
                         });
+                        postSession().then(res => { if (!res.ok) return postSession(); }).catch(postSession);
                         setTimeout(() => {
                             pomodoroTime = 25 * 60;
                             document.getElementById('timer-display').textContent = formatTime(pomodoroTime);
@@ -577,6 +1285,7 @@ def index():
                 document.getElementById('timer-display').textContent = formatTime(pomodoroTime);
                 document.getElementById('pomodoro-status').textContent = "Ready to study!";
                 activeTaskId = null;
+                sessionStartedAt = null;
             });
 
             // --- Journal ---
@@ -649,146 +1358,522 @@ def index():
 """
     return render_template_string(html_content)
 
+# --- Mutations ---
+# Every change to the planner is a named operation on a JSON payload, so it can run
+# in this process or be forwarded to the writer process in single-writer mode.
+def apply_add_task(data, new_task):
+    new_task['id'] = str(uuid.uuid4())
+    new_task['completed'] = False
+    new_task['pomodoroSessions'] = 0
+    data.add_task(new_task)
+
+def apply_update_task(data, update_data):
+    task = data.find_task(update_data['id'])
+    if task is not None:
+        data.update_task(task, update_data)
+        # Add to journal if completed
+        if update_data.get('completed'):
+            today = datetime.now().strftime('%Y-%m-%d')
+            if today not in data.journal:
+                data.set_journal(today, "Completed tasks:\n")
+
+            # Check if the task is already logged in today's journal
+            task_entry = f"- {task.name}\n"
+            if task_entry not in data.journal[today]:
+                data.set_journal(today, data.journal[today] + task_entry)
+
+def apply_delete_task(data, request_data):
+    data.remove_task(request_data['id'])
+
+def apply_add_subject(data, new_subject):
+    new_subject['id'] = str(uuid.uuid4())
+    new_subject['chapters'] = []
+    data.add_subject(new_subject)
+
+def apply_delete_subject(data, request_data):
+    data.remove_subject(request_data['id'])
+
+def apply_add_chapter(data, request_data):
+    subject = data.find_subject(request_data.get('subjectId'))
+    if subject is not None:
+        data.touch_subject(subject)
+        subject.chapters.append(Chapter(str(uuid.uuid4()), request_data.get('chapterName')))
+
+def apply_delete_chapter(data, request_data):
+    chapter_id = request_data.get('chapterId')
+    subject = data.find_subject(request_data.get('subjectId'))
+    if subject is not None:
+        data.touch_subject(subject)
+        subject.chapters = [c for c in subject.chapters if c.id != chapter_id]
+
+def apply_save_journal(data, request_data):
+    entry = request_data['entry']
+    if not isinstance(entry, str):
+        raise ValueError('entry must be a string.')
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    # Prepend existing completed tasks
+    completed_tasks_text = ""
+    if today in data.journal and "Completed tasks:" in data.journal[today]:
+        completed_tasks_text = data.journal[today]
+        data.set_journal(today, entry + "\n\n" + completed_tasks_text)
+    else:
+        data.set_journal(today, entry)
+
+def apply_undo(data, request_data):
+    data.undo()
+
+MUTATIONS = {
+    'add_task': apply_add_task,
+    'update_task': apply_update_task,
+    'delete_task': apply_delete_task,
+    'add_subject': apply_add_subject,
+    'delete_subject': apply_delete_subject,
+    'add_chapter': apply_add_chapter,
+    'delete_chapter': apply_delete_chapter,
+    'undo': apply_undo,
+    'save_journal': apply_save_journal
+}
+
+class WriterError(Exception):
+    """Raised when the writer process cannot be reached or fails to apply a mutation."""
+
+class MutationError(Exception):
+    """Raised when a mutation's payload is missing fields or has invalid values."""
+
+def apply_mutation(op, payload):
+    """Applies a mutation to the planner in this process and saves it."""
+    if op not in MUTATIONS:
+        raise MutationError(f'Unknown operation {op!r}.')
+    data = load_data()
+    data.begin_change()
+    try:
+        MUTATIONS[op](data, payload)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise MutationError(f'Invalid {op} request: {e}') from e
+    finally:
+        # Close the change even on failure, so whatever was applied can still be undone.
+        data.end_change(op)
+    save_data(data)
+    return data.version
+
+def mutate(op, payload):
+    """Applies a mutation, forwarding it to the writer process in single-writer mode."""
+    if not _is_replica():
+        return apply_mutation(op, payload)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(WRITER_TIMEOUT)
+            sock.connect(WRITER_SOCKET)
+            sock.sendall(json.dumps({'op': op, 'payload': payload}).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reply_file:
+                reply = json.loads(reply_file.readline())
+    except (OSError, ValueError) as e:
+        raise WriterError('Writer process is unavailable.') from e
+    if not reply.get('success'):
+        if reply.get('rejected'):
+            raise MutationError(reply.get('error', 'Invalid request.'))
+        raise WriterError(reply.get('error', 'Write failed.'))
+    return reply['version']
+
+class _WriteHandler(socketserver.StreamRequestHandler):
+    """Applies newline-delimited JSON mutations one at a time and replies with the new version."""
+
+    # A worker that stalls mid-message would otherwise block every other write.
+    timeout = WRITER_READ_TIMEOUT
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                reply = {'success': True, 'version': apply_mutation(message['op'], message.get('payload') or {})}
+            except MutationError as e:
+                reply = {'success': False, 'rejected': True, 'error': str(e)}
+            except Exception as e:
+                # Report the failure to the worker; the writer must outlive bad requests.
+                reply = {'success': False, 'error': f'{type(e).__name__}: {e}'}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+def run_writer(socket_path=None):
+    """Runs the single writer process: serialises all mutations and publishes snapshots."""
+    global _is_writer
+    _is_writer = True
+    socket_path = socket_path or WRITER_SOCKET
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    load_data()
+    # UnixStreamServer handles one connection at a time, which keeps writes serialised.
+    with socketserver.UnixStreamServer(socket_path, _WriteHandler) as server:
+        server.serve_forever()
+
+@app.errorhandler(WriterError)
+def writer_error(error):
+    return jsonify({'success': False, 'error': str(error)}), 503
+
+@app.errorhandler(MutationError)
+def mutation_error(error):
+    return jsonify({'success': False, 'error': str(error)}), 400
+
 # --- API Endpoints ---
 @app.route('/get_data')
 def get_data():
     """Endpoint to get all planner data."""
     data = load_data()
-    return jsonify(data)
+    return jsonify(data.to_dict())
 
 @app.route('/add_task', methods=['POST'])
 def add_task():
     """Endpoint to add a new task."""
-    data = load_data()
-    new_task = request.json
-    new_task['id'] = str(uuid.uuid4())
-    new_task['completed'] = False
-    new_task['pomodoroSessions'] = 0
-    data['tasks'].append(new_task)
-    save_data(data)
+    mutate('add_task', request.json)
     return jsonify({'success': True})
 
 @app.route('/update_task', methods=['POST'])
 def update_task():
     """Endpoint to update a task."""
-    data = load_data()
-    update_data = request.json
-    for task in data['tasks']:
-        if task['id'] == update_data['id']:
-            task.update(update_data)
-            # Add to journal if completed
-            if update_data.get('completed'):
-                today = datetime.now().strftime('%Y-%m-%d')
-                if today not in data['journal']:
-                    data['journal'][today] = "Completed tasks:\n"
-                
-                # Check if the task is already logged in today's journal
-                task_entry = f"- {task['name']}\n"
-                if task_entry not in data['journal'][today]:
-                    data['journal'][today] += task_entry
-            break
-    save_data(data)
+    mutate('update_task', request.json)
     return jsonify({'success': True})
 
 @app.route('/delete_task', methods=['POST'])
 def delete_task():
     """Endpoint to delete a task."""
-    data = load_data()
-    task_id = request.json['id']
-    data['tasks'] = [t for t in data['tasks'] if t['id'] != task_id]
-    save_data(data)
+    mutate('delete_task', request.json)
     return jsonify({'success': True})
 
 @app.route('/add_subject', methods=['POST'])
 def add_subject():
     """Endpoint to add a new subject."""
-    data = load_data()
-    new_subject = request.json
-    new_subject['id'] = str(uuid.uuid4())
-    new_subject['chapters'] = []
-    data['subjects'].append(new_subject)
-    save_data(data)
+    mutate('add_subject', request.json)
     return jsonify({'success': True})
 
 @app.route('/delete_subject', methods=['POST'])
 def delete_subject():
     """Endpoint to delete a subject."""
-    data = load_data()
-    subject_id = request.json['id']
-    data['subjects'] = [s for s in data['subjects'] if s['id'] != subject_id]
-    save_data(data)
+    mutate('delete_subject', request.json)
     return jsonify({'success': True})
 
 @app.route('/add_chapter', methods=['POST'])
 def add_chapter():
     """Endpoint to add a new chapter to a subject."""
-    data = load_data()
-    request_data = request.json
-    subject_id = request_data.get('subjectId')
-    chapter_name = request_data.get('chapterName')
-
-    for subject in data['subjects']:
-        if subject['id'] == subject_id:
-            subject['chapters'].append({
-                'id': str(uuid.uuid4()),
-                'name': chapter_name
-            })
-            break
-    
-    save_data(data)
+    mutate('add_chapter', request.json)
     return jsonify({'success': True})
 
 @app.route('/delete_chapter', methods=['POST'])
 def delete_chapter():
     """Endpoint to delete a chapter from a subject."""
-    data = load_data()
-    request_data = request.json
-    subject_id = request_data.get('subjectId')
-    chapter_id = request_data.get('chapterId')
-
-    for subject in data['subjects']:
-        if subject['id'] == subject_id:
-            subject['chapters'] = [c for c in subject['chapters'] if c['id'] != chapter_id]
-            break
-    
-    save_data(data)
+    mutate('delete_chapter', request.json)
     return jsonify({'success': True})
 
 @app.route('/increment_pomodoro', methods=['POST'])
 def increment_pomodoro():
-    """Endpoint to increment pomodoro count for a task."""
-    data = load_data()
-    task_id = request.json['id']
-    for task in data['tasks']:
-        if task['id'] == task_id:
-            task['pomodoroSessions'] = task.get('pomodoroSessions', 0) + 1
-            break
-    save_data(data)
-    return jsonify({'success': True})
+    """Endpoint to log a completed pomodoro session for a task, which also counts
+    towards its pomodoroSessions. Optional 'start'/'end' are epoch seconds; a repeated
+    'idempotencyKey' is only counted once."""
+    request_data = request.json
+    if not isinstance(request_data, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object.'}), 400
+    try:
+        end = int(request_data.get('end') or time.time())
+        start = int(request_data.get('start') or end - POMODORO_SECONDS)
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'success': False, 'error': 'Invalid session times.'}), 400
+    if end < start:
+        return jsonify({'success': False, 'error': 'Session ends before it starts.'}), 400
+    # A start taken before a long pause would count the pause as study time.
+    start = max(start, end - MAX_SESSION_SECONDS)
+    if start < 0 or end > time.time() + MAX_CLOCK_SKEW_SECONDS:
+        return jsonify({'success': False, 'error': 'Session times are out of range.'}), 400
+    key = request_data.get('idempotencyKey') or str(uuid.uuid4())
+    if not isinstance(key, str) or not isinstance(request_data.get('id'), str):
+        return jsonify({'success': False, 'error': 'Invalid task id or idempotency key.'}), 400
+    if load_data().find_task(request_data['id']) is None:
+        return jsonify({'success': False, 'error': 'Unknown task.'}), 400
+    recorded = session_log.record(request_data['id'], start, end, key)
+    return jsonify({'success': True, 'recorded': recorded})
+
+@app.route('/pomodoro/heatmap')
+def pomodoro_heatmap():
+    """Endpoint to get study time per day, or per hour with granularity=hour, between
+    the 'from' and 'to' dates (inclusive, default the last 7 days)."""
+    try:
+        end = date.fromisoformat(request.args.get('to') or date.today().isoformat())
+        start = date.fromisoformat(request.args.get('from') or (end - timedelta(days=6)).isoformat())
+    except (ValueError, OverflowError):
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD.'}), 400
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('day', 'hour') or start > end or (end - start).days >= MAX_HEATMAP_DAYS:
+        return jsonify({'success': False, 'error': 'Invalid heatmap range.'}), 400
+    return jsonify({'success': True, 'buckets': session_log.heatmap(start, end, granularity)})
 
 @app.route('/save_journal', methods=['POST'])
 def save_journal():
     """Endpoint to save a journal entry. Can only be done for the current day."""
-    data = load_data()
-    entry = request.json['entry']
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    # Prepend existing completed tasks
-    completed_tasks_text = ""
-    if today in data['journal'] and "Completed tasks:" in data['journal'][today]:
-        completed_tasks_text = data['journal'][today]
-        data['journal'][today] = entry + "\n\n" + completed_tasks_text
-    else:
-        data['journal'][today] = entry
+    mutate('save_journal', request.json)
+    return jsonify({'success': True})
 
-    save_data(data)
+@app.route('/undo', methods=['POST'])
+def undo():
+    """Endpoint to revert the most recent change."""
+    mutate('undo', {})
     return jsonify({'success': True})
 
+@app.route('/history')
+def history():
+    """Endpoint to list the changes that can be undone, newest first."""
+    data = load_data()
+    return jsonify({'history': [
+        {
+            'op': entry['op'],
+            'at': entry['at'],
+            'changes': len(entry['tasks']) + len(entry['subjects']) + len(entry['journal'])
+        }
+        for entry in reversed(data.history)
+    ]})
+
 @app.route('/journal/<date_str>')
 def get_journal_entry(date_str):
     """Endpoint to get a specific journal entry."""
     data = load_data()
-    return jsonify({'entry': data['journal'].get(date_str, '')})
+    return jsonify({'entry': data.journal.get(date_str, '')})
+
+# --- Scheduling ---
+DEFAULT_DAILY_CAPACITY = 4
+DEFAULT_TASK_EFFORT = 1
+NO_DEADLINE = date.max.toordinal()
+MAX_CACHED_SCHEDULERS = 8
+# Tasks that do not fit in this many days from the start are reported as unscheduled.
+MAX_SCHEDULE_DAYS = 731
+
+class _PlanEntry:
+    """One incomplete task in a schedule, with where its allocation starts."""
+    __slots__ = ('key', 'task', 'effort', 'cursor', 'allocations')
+
+    def __init__(self, key, task, effort):
+        self.key = key
+        self.task = task
+        self.effort = effort
+        self.cursor = None
+        self.allocations = []
+
+class StudyScheduler:
+    """Packs incomplete tasks into daily pomodoro capacity, earliest deadline first.
+
+    Tasks in the same subject are chained by chapter order: a task's effective
+    deadline is the earliest deadline of itself and every task in a later chapter,
+    so popping the EDF heap in deadline order can never run a later chapter ahead
+    of an earlier one. That pop order is a total order on
+    (effective deadline, subject position, chapter position, deadline, id), so it
+    is kept as a sorted list and edits are spliced in with bisect. Each entry
+    remembers the (day, capacity left) cursor it started from, which lets
+    sync() replan only from the first changed entry onwards.
+    """
+
+    def __init__(self, start, capacity, overrides=None):
+        self.start = start
+        self.capacity = capacity
+        # First day past the plan, kept within the range of date ordinals.
+        self.horizon = min(start + MAX_SCHEDULE_DAYS, NO_DEADLINE)
+        self.overrides = {day: n for day, n in (overrides or {}).items() if start <= day < self.horizon}
+        self.last_override = max(self.overrides) if self.overrides else start
+        self.keys = []
+        self.entries = []
+        self.by_id = {}
+
+    def day_capacity(self, day):
+        return self.overrides.get(day, self.capacity)
+
+    def sync(self, planner, efforts=None, default_effort=DEFAULT_TASK_EFFORT):
+        """Brings the plan in line with the planner's tasks, replanning only what changed."""
+        wanted = self._build_entries(planner, efforts or {}, default_effort)
+        removed = [self.by_id[task_id] for task_id in self.by_id if task_id not in wanted]
+        added = []
+        for task_id, entry in wanted.items():
+            old = self.by_id.get(task_id)
+            if old is None:
+                added.append(entry)
+            elif old.key != entry.key or old.effort != entry.effort:
+                removed.append(old)
+                added.append(entry)
+            else:
+                old.task = entry.task
+        if not removed and not added:
+            return
+        if len(removed) + len(added) > len(self.entries) // 4:
+            # Large edits are cheaper as a fresh sort than as many list splices.
+            self.entries = sorted(wanted.values(), key=lambda e: e.key)
+            self.keys = [e.key for e in self.entries]
+            self.by_id = wanted
+            self._allocate(0)
+            return
+        first_changed = len(self.entries)
+        for entry in removed:
+            index = bisect.bisect_left(self.keys, entry.key)
+            del self.keys[index]
+            del self.entries[index]
+            del self.by_id[entry.task.id]
+            first_changed = min(first_changed, index)
+        for entry in added:
+            index = bisect.bisect_left(self.keys, entry.key)
+            self.keys.insert(index, entry.key)
+            self.entries.insert(index, entry)
+            self.by_id[entry.task.id] = entry
+            first_changed = min(first_changed, index)
+        self._allocate(first_changed)
+
+    def _build_entries(self, planner, efforts, default_effort):
+        subjects = planner.subjects
+        subject_rank = {s.id: i for i, s in enumerate(subjects)}
+        chapter_rank = {}
+        for subject in subjects:
+            for i, chapter in enumerate(subject.chapters):
+                chapter_rank[(subject.id, chapter.id)] = i
+
+        entries = {}
+        chapter_deadlines = {}
+        for task in planner.tasks:
+            if task.completed:
+                continue
+            deadline = planner.dates[task.slot] or NO_DEADLINE
+            subject_id = task.subject_id
+            chapter = chapter_rank.get((subject_id, task.chapter_id), -1)
+            if chapter >= 0:
+                group = chapter_deadlines.setdefault(subject_id, {})
+                group[chapter] = min(group.get(chapter, NO_DEADLINE), deadline)
+            effort = efforts.get(task.id, planner.efforts[task.slot] or default_effort)
+            remaining = max(effort - planner.sessions[task.slot], 1)
+            key = (deadline, subject_rank.get(subject_id, len(subjects)), chapter, deadline, task.id)
+            entries[task.id] = _PlanEntry(key, task, remaining)
+
+        # Suffix-min of deadlines over later chapters gives each chapter its effective deadline.
+        effective = {}
+        for subject_id, group in chapter_deadlines.items():
+            running = NO_DEADLINE
+            for chapter in sorted(group, reverse=True):
+                running = min(running, group[chapter])
+                effective[(subject_id, chapter)] = running
+        for entry in entries.values():
+            deadline, subject, chapter, _, task_id = entry.key
+            if chapter >= 0:
+                entry.key = (effective[(entry.task.subject_id, chapter)], subject, chapter, deadline, task_id)
+        return entries
+
+    def _allocate(self, position):
+        if position > 0:
+            day, left = self._cursor_after(self.entries[position - 1])
+        else:
+            day, left = self.start, self.day_capacity(self.start)
+
+        for entry in self.entries[position:]:
+            entry.cursor = (day, left)
+            entry.allocations = []
+            remaining = entry.effort
+            while remaining:
+                while left == 0:
+                    if day + 1 >= self.horizon or (day >= self.last_override and self.capacity <= 0):
+                        break
+                    day += 1
+                    left = self.day_capacity(day)
+                if left == 0:
+                    break
+                take = min(remaining, left)
+                entry.allocations.append((day, take))
+                remaining -= take
+                left -= take
+
+    def _cursor_after(self, entry):
+        if not entry.allocations:
+            return entry.cursor
+        day, _ = entry.allocations[-1]
+        used = sum(n for d, n in entry.allocations if d == day)
+        start_day, start_left = entry.cursor
+        if start_day == day:
+            return day, start_left - used
+        return day, self.day_capacity(day) - used
+
+    def plan(self):
+        """Returns the day-by-day plan and the tasks that miss their deadline."""
+        days = {}
+        infeasible = []
+        for entry in self.entries:
+            task = entry.task
+            for day, count in entry.allocations:
+                days.setdefault(day, []).append({
+                    'taskId': task.id,
+                    'name': task.name,
+                    'subjectId': task.subject_id,
+                    'pomodoros': count
+                })
+            scheduled = sum(n for _, n in entry.allocations)
+            finish = entry.allocations[-1][0] if entry.allocations else None
+            deadline = entry.key[3]
+            if scheduled < entry.effort or (deadline != NO_DEADLINE and finish > deadline):
+                infeasible.append({
+                    'taskId': task.id,
+                    'name': task.name,
+                    'deadline': date.fromordinal(deadline).isoformat() if deadline != NO_DEADLINE else '',
+                    'finish': date.fromordinal(finish).isoformat() if finish else None,
+                    'unscheduled': entry.effort - scheduled
+                })
+        return {
+            'days': [
+                {
+                    'date': date.fromordinal(day).isoformat(),
+                    'capacity': self.day_capacity(day),
+                    'used': sum(item['pomodoros'] for item in items),
+                    'items': items
+                }
+                for day, items in sorted(days.items())
+            ],
+            'infeasible': infeasible
+        }
+
+_scheduler_cache = OrderedDict()
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(start, capacity, overrides):
+    """Returns the cached scheduler for these settings, so repeat calls only replan changes."""
+    cache_key = (start, capacity, tuple(sorted(overrides.items())))
+    scheduler = _scheduler_cache.pop(cache_key, None)
+    if scheduler is None:
+        scheduler = StudyScheduler(start, capacity, overrides)
+    _scheduler_cache[cache_key] = scheduler
+    while len(_scheduler_cache) > MAX_CACHED_SCHEDULERS:
+        _scheduler_cache.popitem(last=False)
+    return scheduler
+
+@app.route('/schedule', methods=['GET', 'POST'])
+def schedule():
+    """Endpoint to plan incomplete tasks into daily pomodoro capacity.
+
+    Accepts 'capacity' (pomodoros per day), 'capacityOverrides' ({date: pomodoros}),
+    'efforts' ({taskId: pomodoros}, falling back to a task's 'estimatedPomodoros'),
+    'defaultEffort' and 'start' (defaults to today), as JSON or query parameters.
+    """
+    params = request.get_json(silent=True) or request.args
+    try:
+        capacity = int(params.get('capacity', DEFAULT_DAILY_CAPACITY))
+        default_effort = int(params.get('defaultEffort', DEFAULT_TASK_EFFORT))
+        start = date.fromisoformat(params.get('start') or date.today().isoformat()).toordinal()
+        overrides = {
+            date.fromisoformat(day).toordinal(): int(n)
+            for day, n in (params.get('capacityOverrides') or {}).items()
+        }
+        efforts = {task_id: int(n) for task_id, n in (params.get('efforts') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'error': 'Invalid schedule parameters.'}), 400
+    if (capacity < 0 or default_effort < 1 or any(n < 0 for n in overrides.values())
+            or any(n < 1 for n in efforts.values())):
+        return jsonify({'success': False, 'error': 'Capacity and effort must be positive.'}), 400
+
+    data = load_data()
+    with _scheduler_lock:
+        scheduler = get_scheduler(start, capacity, overrides)
+        scheduler.sync(data, efforts, default_effort)
+        result = scheduler.plan()
+    result['success'] = True
+    return jsonify(result)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    if '--writer' in sys.argv:
+        run_writer()
+    else:
+        app.run(debug=True)